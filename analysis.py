@@ -0,0 +1,94 @@
+from typing import List, Callable, Optional
+from epidata import CountryEpiData, WorldEpiData
+from georegions_indicators import GeoRegionsIndicator
+from correlation_gallery import CorrelationGallery, CorrelationFactor
+from correlation_cache import calc_cache_key
+from region_hierarchy import LEVEL_COUNTRY
+
+"""
+Shared steps to set up a correlation analysis between country indicators and epi metrics.
+Used by both the charting (main.py) and the compute-only (compute_metrics.py) entry points
+"""
+
+
+def build_correlation_gallery(
+        countries: List[CountryEpiData], indicators: List[GeoRegionsIndicator], epi_metrics: list,
+        indicator_value_getter: Optional[Callable[[GeoRegionsIndicator, CountryEpiData], Optional[float]]] = None
+) -> CorrelationGallery:
+    """Creates a correlation gallery with the indicators as X factors, the epi metrics as Y factors,
+       and a data point for each country (or aggregate region).
+       The epi metrics should already have been calculated on the countries.
+       By default, indicator values are looked up by country code; aggregate regions need their own getter"""
+    if indicator_value_getter is None:
+        indicator_value_getter = lambda indicator, country: indicator.get_region_value(country.get_code())
+
+    # Initiate the correlation gallery, showing a grid of correlations between
+    #   1. The country indicators
+    #   2. The epi metrics
+    corr_gallery = CorrelationGallery()
+
+    # Load the indicators as X axis factors
+    for indicator in indicators:
+        corr_gallery.add_dimx_factor(CorrelationFactor(
+            id=indicator.get_id(),
+            name=indicator.get_name()
+        ))
+
+    # Load the epi metrics as Y axis factors
+    for epi_metric in epi_metrics:
+        corr_gallery.add_dimy_factor(CorrelationFactor(
+            id=epi_metric.get_id(),
+            name=epi_metric.get_description()
+        ))
+
+    # Determine the maximum population size (used to scale the points in the correlation scatter plot points)
+    max_population = max([
+        ctry.get_population_size()
+        for ctry in countries
+    ])
+
+    # Load all the country data points used for the correlation analysis,
+    # and set the values for both the epi metrics & indicator factors
+    for country in countries:
+        point_id = country.get_code()
+        # Add the data point
+        corr_gallery.add_datapoint(
+            point_id=point_id,
+            name=country.get_name(),
+            size_frac=country.get_population_size() / max_population,
+            color_cat=country.get_continent()
+        )
+        # Set the X values (indicators)
+        for indicator in indicators:
+            corr_gallery.add_dimx_value(
+                point_id=point_id,
+                factor_id=indicator.get_id(),
+                value=indicator_value_getter(indicator, country)
+            )
+        # Set the Y values (epi metrics)
+        for epi_metric in epi_metrics:
+            corr_gallery.add_dimy_value(
+                point_id=point_id,
+                factor_id=epi_metric.get_id(),
+                value=country.get_metric(epi_metric.get_id())
+            )
+
+    return corr_gallery
+
+
+def calc_correlation_cache_key(
+        world_epi_data: WorldEpiData, regions: List[CountryEpiData], indicators: List[GeoRegionsIndicator],
+        epi_metrics: list, region_level: str = LEVEL_COUNTRY
+) -> str:
+    """Returns the correlation cache key matching the gallery built by build_correlation_gallery,
+       using the regions (at a given level of the region hierarchy) as data points"""
+    source_files = [world_epi_data.get_source_file()]
+    for indicator in indicators:
+        source_files += indicator.get_source_files()
+    return calc_cache_key(
+        source_files=source_files,
+        filter_chain=world_epi_data.get_filter_chain() + [f'Region level {region_level}'],
+        datapoint_ids=[region.get_code() for region in regions],
+        dimx_factor_ids=[indicator.get_id() for indicator in indicators],
+        dimy_factor_ids=[epi_metric.get_id() for epi_metric in epi_metrics],
+    )
@@ -0,0 +1,79 @@
+import subprocess
+import sys
+import time
+
+"""
+Import-time benchmark, guarding the startup cost of the compute-only entry point.
+Each module is imported in a fresh interpreter, so that nothing is cached between runs.
+Exits with a non-zero status if a heavy module gets loaded at import time, or if the startup budget is exceeded.
+Usage:
+    python benchmark_import_time.py
+"""
+
+
+# Modules that should only get imported when actually used, and never at module load
+HEAVY_MODULES = ['matplotlib', 'scipy']
+
+# Modules that are checked, i.e. everything that the compute-only entry point loads
+CHECKED_MODULES = [
+    'epidata',
+    'epi_metrics',
+    'georegions_indicators',
+    'correlation_cache',
+    'correlation_gallery',
+    'region_hierarchy',
+    'indicator_screening',
+    'columnar_export',
+    'analysis',
+    'compute_metrics',
+]
+
+REPEAT_COUNT = 5
+
+# numpy is a core dependency, used at module load by most modules.
+# Import times are measured on top of an interpreter that only imports numpy, so that they don't vary with its cost
+BASELINE_CODE = 'import numpy'
+
+# Maximum allowed median import time of a single module (seconds), on top of the baseline
+MAX_IMPORT_SECONDS = 0.25
+
+
+def time_command(code: str) -> float:
+    """Returns the median wall time of running a piece of code in a fresh interpreter"""
+    timings = []
+    for _ in range(REPEAT_COUNT):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def get_loaded_heavy_modules(module_name: str) -> list:
+    code = (
+        f'import sys; import {module_name}; '
+        f'print(" ".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))'
+    )
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+    return output.split()
+
+
+def main() -> int:
+    failures = []
+    baseline = time_command(BASELINE_CODE)
+    print(f'Baseline ({BASELINE_CODE}): {1000 * baseline:.1f} ms')
+    for module_name in CHECKED_MODULES:
+        import_time = time_command(f'{BASELINE_CODE}; import {module_name}') - baseline
+        heavy_modules = get_loaded_heavy_modules(module_name)
+        print(f'{module_name}: {1000 * import_time:.1f} ms; heavy modules loaded: {heavy_modules or "none"}')
+        if heavy_modules:
+            failures.append(f'{module_name} loads {heavy_modules} at import time')
+        if import_time > MAX_IMPORT_SECONDS:
+            failures.append(f'{module_name} import takes {1000 * import_time:.1f} ms')
+    for failure in failures:
+        print(f'FAILED: {failure}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
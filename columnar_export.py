@@ -0,0 +1,140 @@
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from epidata import CountryEpiData
+from georegions_indicators import GeoRegionsIndicator
+from correlation_gallery import CorrelationGallery
+from indicator_screening import build_indicator_matrix
+
+"""
+Columnar export of the computed metrics, indicator values & correlation results, for use by other tools.
+Each table is a folder holding one .npy file per column and a schema.json describing the columns.
+Columns are written in bulk, and can be memory mapped when read back, so that loading them does not copy the data.
+Usage example:
+    table = ColumnarTable('output/columnar/metrics')
+    codes = table.get_column('Code')
+    total_cases = table.get_column('TotCasesFrac')
+"""
+
+
+SCHEMA_FILE_NAME = 'schema.json'
+
+FORMAT_VERSION = 1
+
+
+def write_columnar_table(table_dir: str, columns: Dict[str, np.ndarray], attributes: Optional[dict] = None):
+    """Writes a table of equal length columns. Columns may have extra dimensions (e.g. a matrix, one row per row)"""
+    row_counts = {len(values) for values in columns.values()}
+    assert len(row_counts) == 1, 'All columns must have the same number of rows'
+    # The table is built in a temporary folder, and then swapped into place.
+    # This way, readers never see a mix of old & new columns, and no columns of an earlier export are left behind
+    table_dir = table_dir.rstrip('/')
+    temp_dir = f'{table_dir}.{os.getpid()}.tmp'
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    columns_schema = []
+    for col_nr, (name, values) in enumerate(columns.items()):
+        file_name = f'col_{col_nr}.npy'
+        np.save(f'{temp_dir}/{file_name}', np.ascontiguousarray(values), allow_pickle=False)
+        columns_schema.append({
+            'name': name,
+            'file': file_name,
+            'dtype': values.dtype.str,
+            'shape': list(values.shape),
+        })
+    with open(f'{temp_dir}/{SCHEMA_FILE_NAME}', 'w') as schema_file:
+        json.dump({
+            'format_version': FORMAT_VERSION,
+            'row_count': row_counts.pop(),
+            'columns': columns_schema,
+            'attributes': attributes or {},
+        }, schema_file, indent=2)
+    # A folder can only be renamed onto a non existing path, so the old table is moved out of the way first
+    old_dir = f'{table_dir}.{os.getpid()}.old'
+    if os.path.exists(table_dir):
+        os.replace(table_dir, old_dir)
+    os.replace(temp_dir, table_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+class ColumnarTable:
+    """Reads a table written by write_columnar_table. Columns are memory mapped, and loaded on first access"""
+
+    def __init__(self, table_dir: str):
+        self._table_dir = Path(table_dir)
+        with open(self._table_dir / SCHEMA_FILE_NAME) as schema_file:
+            self._schema = json.load(schema_file)
+        if self._schema['format_version'] != FORMAT_VERSION:
+            raise Exception(f'Unsupported columnar table format version {self._schema["format_version"]}')
+        self._columns_idx = {column['name']: column for column in self._schema['columns']}
+        self._loaded_columns: Dict[str, np.ndarray] = {}
+
+    def get_row_count(self) -> int:
+        return self._schema['row_count']
+
+    def get_column_names(self) -> List[str]:
+        return [column['name'] for column in self._schema['columns']]
+
+    def get_attributes(self) -> dict:
+        return self._schema['attributes']
+
+    def get_column(self, name: str) -> np.ndarray:
+        if name not in self._columns_idx:
+            raise Exception(f'Invalid column {name}')
+        if name not in self._loaded_columns:
+            column = self._columns_idx[name]
+            values = np.load(self._table_dir / column['file'], mmap_mode='r', allow_pickle=False)
+            assert values.dtype.str == column['dtype'] and list(values.shape) == column['shape']
+            self._loaded_columns[name] = values
+        return self._loaded_columns[name]
+
+
+def _optional_floats(values: list) -> np.ndarray:
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+
+def export_metrics(table_dir: str, regions: List[CountryEpiData], epi_metrics: list):
+    """Exports the epi metrics, one row per country (or aggregate region)"""
+    columns = {
+        'Code': np.array([region.get_code() for region in regions], dtype=str),
+        'Name': np.array([region.get_name() for region in regions], dtype=str),
+        'Continent': np.array([region.get_continent() for region in regions], dtype=str),
+        'Population': _optional_floats([region.get_population_size() for region in regions]),
+    }
+    for metric in epi_metrics:
+        columns[metric.get_id()] = _optional_floats([region.get_metric(metric.get_id()) for region in regions])
+    write_columnar_table(table_dir, columns, {
+        'metric_descriptions': {metric.get_id(): metric.get_description() for metric in epi_metrics},
+    })
+
+
+def export_indicators(
+        table_dir: str, indicators: List[GeoRegionsIndicator], regions: List[CountryEpiData],
+        indicator_value_getter: Optional[Callable[[GeoRegionsIndicator, CountryEpiData], Optional[float]]] = None
+):
+    """Exports the indicator values, one row per country (or aggregate region), NaN for missing values"""
+    values = build_indicator_matrix(indicators, regions, indicator_value_getter)
+    columns = {'Code': np.array([region.get_code() for region in regions], dtype=str)}
+    for col_nr, indicator in enumerate(indicators):
+        columns[indicator.get_id()] = values[:, col_nr]
+    write_columnar_table(table_dir, columns, {
+        'indicator_names': {indicator.get_id(): indicator.get_name() for indicator in indicators},
+    })
+
+
+def export_correlations(table_dir: str, corr_gallery: CorrelationGallery):
+    """Exports the correlation matrix: one row per X factor, with the r and p values for all Y factors.
+       The Y factor ids are stored as a table attribute, in column order of the r and p matrices"""
+    entry = corr_gallery.get_cache_entry()
+    write_columnar_table(table_dir, {
+        'FactorId': np.array(entry.dimx_ids, dtype=str),
+        'FactorName': np.array(entry.dimx_names, dtype=str),
+        'r': entry.r_matrix,
+        'p': entry.p_matrix,
+    }, {
+        'dimy_ids': entry.dimy_ids,
+        'dimy_names': entry.dimy_names,
+    })
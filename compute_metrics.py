@@ -0,0 +1,142 @@
+import argparse
+import csv
+import os
+from typing import List
+from epidata import WorldEpiData, CountryEpiData
+from epi_metrics import calc_region_metrics, get_epi_metrics_list
+from georegions_indicators import load_all_georegions_indicators
+from analysis import build_correlation_gallery, calc_correlation_cache_key
+from correlation_gallery import CorrelationGallery
+from correlation_cache import CorrelationCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_SIZE_BYTES
+from region_hierarchy import RegionHierarchy, LEVEL_COUNTRY, LEVEL_CONTINENT
+from indicator_screening import screen_indicators, IndicatorPairCorrelation
+from columnar_export import export_metrics, export_indicators, export_correlations
+
+"""
+Compute-only entry point: calculates the epi metrics and the correlations with the country indicators,
+and writes them as tab separated tables, without loading the plotting stack.
+Usage example:
+    python compute_metrics.py --continent Africa --output-dir output
+"""
+
+
+def clean_label(label: str) -> str:
+    return label.replace('\n', ' ')
+
+
+def write_metrics_table(file_name: str, regions: List[CountryEpiData], epi_metrics: list):
+    with open(file_name, 'w', newline='') as tsvfile:
+        writer = csv.writer(tsvfile, delimiter='\t')
+        writer.writerow(['Code', 'Name', 'Continent', 'Population'] + [metric.get_id() for metric in epi_metrics])
+        for country in regions:
+            writer.writerow(
+                [country.get_code(), country.get_name(), country.get_continent(), country.get_population_size()] +
+                [country.get_metric(metric.get_id()) for metric in epi_metrics]
+            )
+
+
+def write_correlations_table(file_name: str, corr_gallery: CorrelationGallery):
+    corr_matrix = corr_gallery.get_corr_matrix()
+    with open(file_name, 'w', newline='') as tsvfile:
+        writer = csv.writer(tsvfile, delimiter='\t')
+        writer.writerow(['IndicatorId', 'IndicatorName', 'MetricId', 'MetricName', 'r', 'p'])
+        for ix, fac_x in enumerate(corr_gallery.get_dimx_factors()):
+            for iy, fac_y in enumerate(corr_gallery.get_dimy_factors()):
+                corr = corr_matrix[ix][iy]
+                writer.writerow([
+                    fac_x.get_id(), clean_label(fac_x.get_name()),
+                    fac_y.get_id(), clean_label(fac_y.get_name()),
+                    corr.get_r(), corr.get_p()
+                ])
+
+
+def write_indicator_pairs_table(file_name: str, indicator_pairs: List[IndicatorPairCorrelation]):
+    with open(file_name, 'w', newline='') as tsvfile:
+        writer = csv.writer(tsvfile, delimiter='\t')
+        writer.writerow(['IndicatorIdA', 'IndicatorIdB', 'r', 'p', 'RegionCount'])
+        for indicator_pair in indicator_pairs:
+            corr = indicator_pair.get_correlation()
+            writer.writerow(list(indicator_pair.get_indicator_ids()) + [
+                corr.get_r(), corr.get_p(), indicator_pair.get_region_count()
+            ])
+
+
+def parse_arguments(args: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Calculate COVID-19 epi metrics & their correlations with country indicators')
+    parser.add_argument('--data-file', default='COVID-19_cases_worldwide', help='Epi data file name, in the data folder')
+    parser.add_argument('--continent', default=None, help='Restrict to a single continent')
+    parser.add_argument('--min-population', type=int, default=100000, help='Minimum country population size')
+    parser.add_argument('--min-total-cases', type=int, default=200, help='Minimum total number of cases')
+    parser.add_argument('--level', choices=[LEVEL_COUNTRY, LEVEL_CONTINENT], default=LEVEL_COUNTRY,
+                        help='Region level used as data points')
+    parser.add_argument('--sort-by', default='TotCasesFrac', help='Epi metric used to sort the indicators by significance')
+    parser.add_argument('--output-dir', default='output', help='Folder where the tables are written')
+    parser.add_argument('--export-dir', default=None,
+                        help='Folder where metrics, indicators & correlations are also exported as columnar tables')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Folder of the correlation results cache')
+    parser.add_argument('--cache-max-mb', type=float, default=DEFAULT_MAX_SIZE_BYTES / (1024 * 1024),
+                        help='Maximum size of the correlation results cache (MB)')
+    parser.add_argument('--no-cache', action='store_true', help='Always recalculate the correlations')
+    parser.add_argument('--screen-indicators', action='store_true',
+                        help='Also screen all indicator pairs for redundant & collinear indicators')
+    parser.add_argument('--screen-top-k', type=int, default=5,
+                        help='Number of most correlated pairs retained per indicator when screening (0: no limit)')
+    parser.add_argument('--screen-min-abs-r', type=float, default=None,
+                        help='Only retain screened pairs with at least this absolute correlation')
+    parser.add_argument('--workers', type=int, default=None, help='Number of processes used for screening')
+    options = parser.parse_args(args)
+    if options.screen_indicators and (options.screen_top_k <= 0) and (options.screen_min_abs_r is None):
+        parser.error('--screen-indicators needs a positive --screen-top-k, or a --screen-min-abs-r threshold')
+    return options
+
+
+def main(args: List[str] = None):
+    options = parse_arguments(args)
+
+    # The continent filter is applied while loading, so that rows of other continents are skipped before parsing
+    world_epi_data = WorldEpiData(options.data_file, continents=[options.continent] if options.continent else None)
+    world_epi_data.filter_min_population_size(options.min_population)
+    world_epi_data.filter_min_total_cases(options.min_total_cases)
+
+    epi_metrics = get_epi_metrics_list()
+    indicators = load_all_georegions_indicators()
+    if options.level == LEVEL_COUNTRY:
+        regions = world_epi_data.get_all_countries()
+        indicator_value_getter = None
+    else:
+        hierarchy = RegionHierarchy(world_epi_data)
+        regions = hierarchy.get_level_regions(options.level)
+        indicator_value_getter = hierarchy.get_indicator_value
+    calc_region_metrics(regions)
+
+    corr_gallery = build_correlation_gallery(regions, indicators, epi_metrics, indicator_value_getter)
+    if options.no_cache:
+        corr_gallery.calc_correlations()
+    else:
+        corr_gallery.calc_correlations(
+            cache=CorrelationCache(options.cache_dir, int(options.cache_max_mb * 1024 * 1024)),
+            cache_key=calc_correlation_cache_key(world_epi_data, regions, indicators, epi_metrics, options.level)
+        )
+    corr_gallery.sort_dimx_by_significance(dimy_factor=options.sort_by)
+
+    os.makedirs(options.output_dir, exist_ok=True)
+    write_metrics_table(f'{options.output_dir}/metrics.tsv', regions, epi_metrics)
+    write_correlations_table(f'{options.output_dir}/correlations.tsv', corr_gallery)
+    if options.export_dir:
+        export_metrics(f'{options.export_dir}/metrics', regions, epi_metrics)
+        export_indicators(f'{options.export_dir}/indicators', indicators, regions, indicator_value_getter)
+        export_correlations(f'{options.export_dir}/correlations', corr_gallery)
+        print(f'Columnar tables exported to {options.export_dir}')
+    if options.screen_indicators:
+        indicator_pairs = screen_indicators(
+            indicators, regions, indicator_value_getter,
+            top_k=options.screen_top_k if options.screen_top_k > 0 else None,
+            min_abs_r=options.screen_min_abs_r,
+            worker_count=options.workers
+        )
+        write_indicator_pairs_table(f'{options.output_dir}/indicator_pairs.tsv', indicator_pairs)
+    print(f'Tables written to {options.output_dir}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import zipfile
+from pathlib import Path
+from typing import List, Optional, Tuple
+import numpy as np
+
+"""
+Persistent on-disk cache of correlation gallery results.
+Entries are content addressed: the key is a hash of everything that determines the result
+(source file fingerprints, filter chain, data point codes, factor ids and correlation method).
+Each entry is stored as an uncompressed numpy .npz file; the least recently used entries are evicted
+when the total cache size exceeds its bound.
+"""
+
+
+DEFAULT_CACHE_DIR = 'cache'
+
+DEFAULT_MAX_SIZE_BYTES = 64 * 1024 * 1024
+
+CACHE_FILE_SUFFIX = '.npz'
+
+TEMP_FILE_SUFFIX = '.tmp'
+
+
+def get_file_fingerprint(file_name: str) -> str:
+    """Cheap fingerprint of a source file, changing whenever the file gets replaced or modified"""
+    stat = os.stat(file_name)
+    return f'{Path(file_name).name}:{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def calc_cache_key(
+        source_files: List[str], filter_chain: List[str], datapoint_ids: List[str],
+        dimx_factor_ids: List[str], dimy_factor_ids: List[str], method: str = 'spearman'
+) -> str:
+    """The filter chain only describes the filters, so the resulting data points (in order) are part of the key as well"""
+    key_content = json.dumps({
+        'sources': sorted(get_file_fingerprint(file_name) for file_name in source_files),
+        'filters': filter_chain,
+        'datapoints': datapoint_ids,
+        'dimx': dimx_factor_ids,
+        'dimy': dimy_factor_ids,
+        'method': method,
+    })
+    return hashlib.sha256(key_content.encode('utf-8')).hexdigest()
+
+
+def _ranges_to_array(ranges: List[Tuple[float, float]]) -> np.ndarray:
+    return np.array(
+        [[np.nan if val is None else val for val in value_range] for value_range in ranges],
+        dtype=np.float64
+    ).reshape(-1, 2)
+
+
+def _array_to_ranges(array: np.ndarray) -> List[Tuple[float, float]]:
+    return [
+        tuple(None if np.isnan(val) else float(val) for val in row)
+        for row in array
+    ]
+
+
+class CorrelationCacheEntry:
+    """The cached results of a correlation gallery calculation: factors, their value ranges, and r/p matrices"""
+
+    def __init__(
+            self,
+            dimx_ids: List[str], dimx_names: List[str], dimx_ranges: List[Tuple[float, float]],
+            dimy_ids: List[str], dimy_names: List[str], dimy_ranges: List[Tuple[float, float]],
+            r_matrix: np.ndarray, p_matrix: np.ndarray
+    ):
+        assert r_matrix.shape == p_matrix.shape == (len(dimx_ids), len(dimy_ids))
+        self.dimx_ids = dimx_ids
+        self.dimx_names = dimx_names
+        self.dimx_ranges = dimx_ranges
+        self.dimy_ids = dimy_ids
+        self.dimy_names = dimy_names
+        self.dimy_ranges = dimy_ranges
+        self.r_matrix = r_matrix
+        self.p_matrix = p_matrix
+
+    def save(self, file_name: str):
+        with open(file_name, 'wb') as cache_file:
+            np.savez(
+                cache_file,
+                dimx_ids=np.array(self.dimx_ids, dtype=str),
+                dimx_names=np.array(self.dimx_names, dtype=str),
+                dimx_ranges=_ranges_to_array(self.dimx_ranges),
+                dimy_ids=np.array(self.dimy_ids, dtype=str),
+                dimy_names=np.array(self.dimy_names, dtype=str),
+                dimy_ranges=_ranges_to_array(self.dimy_ranges),
+                r_matrix=self.r_matrix.astype(np.float64),
+                p_matrix=self.p_matrix.astype(np.float64),
+            )
+
+    @staticmethod
+    def load(file_name: str) -> 'CorrelationCacheEntry':
+        with np.load(file_name, allow_pickle=False) as data:
+            return CorrelationCacheEntry(
+                dimx_ids=data['dimx_ids'].tolist(),
+                dimx_names=data['dimx_names'].tolist(),
+                dimx_ranges=_array_to_ranges(data['dimx_ranges']),
+                dimy_ids=data['dimy_ids'].tolist(),
+                dimy_names=data['dimy_names'].tolist(),
+                dimy_ranges=_array_to_ranges(data['dimy_ranges']),
+                r_matrix=data['r_matrix'],
+                p_matrix=data['p_matrix'],
+            )
+
+
+class CorrelationCache:
+    """Size bounded, least recently used, on-disk store of correlation cache entries"""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_size_bytes: int = DEFAULT_MAX_SIZE_BYTES):
+        self._cache_dir = Path(cache_dir)
+        self._max_size_bytes = max_size_bytes
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _get_file_name(self, key: str) -> Path:
+        return self._cache_dir / f'{key}{CACHE_FILE_SUFFIX}'
+
+    def get(self, key: str) -> Optional[CorrelationCacheEntry]:
+        file_name = self._get_file_name(key)
+        if not file_name.exists():
+            return None
+        try:
+            entry = CorrelationCacheEntry.load(str(file_name))
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as err:
+            print(f'WARNING: discarding unreadable correlation cache entry {file_name.name}: {err}')
+            file_name.unlink(missing_ok=True)
+            return None
+        # Mark as recently used, so that it is evicted last
+        os.utime(file_name)
+        print(f'CORRELATION CACHE: hit {key[:12]}')
+        return entry
+
+    def put(self, key: str, entry: CorrelationCacheEntry):
+        file_name = self._get_file_name(key)
+        # Write to a temporary file first, so that concurrent readers never see a partial entry
+        temp_file_name = file_name.with_name(f'{file_name.name}.{os.getpid()}{TEMP_FILE_SUFFIX}')
+        entry.save(str(temp_file_name))
+        os.replace(temp_file_name, file_name)
+        print(f'CORRELATION CACHE: stored {key[:12]}')
+        self.evict(keep_key=key)
+
+    def evict(self, keep_key: Optional[str] = None):
+        """Removes the least recently used entries until the total cache size is within bounds.
+           The entry for keep_key (typically the one just stored) is never removed.
+           Also cleans up temporary files left behind by interrupted writes of other processes"""
+        keep_file_name = f'{keep_key}{CACHE_FILE_SUFFIX}'
+        entries = []
+        total_size = 0
+        for item in self._cache_dir.iterdir():
+            try:
+                if item.name.endswith(TEMP_FILE_SUFFIX):
+                    if not self._is_active_temp_file(item):
+                        item.unlink()
+                elif item.name.endswith(CACHE_FILE_SUFFIX):
+                    stat = item.stat()
+                    total_size += stat.st_size
+                    if item.name != keep_file_name:
+                        entries.append((stat.st_mtime_ns, stat.st_size, item))
+            except FileNotFoundError:
+                # Already removed by another process
+                pass
+        entries.sort(key=lambda entry: entry[0])
+        for _, size, item in entries:
+            if total_size <= self._max_size_bytes:
+                break
+            item.unlink(missing_ok=True)
+            total_size -= size
+            print(f'CORRELATION CACHE: evicted {item.name[:12]}')
+
+    @staticmethod
+    def _is_active_temp_file(item: Path) -> bool:
+        """Checks whether a temporary file is still being written, i.e. whether the writing process is alive"""
+        pid = item.name[:-len(TEMP_FILE_SUFFIX)].rpartition('.')[2]
+        if not pid.isdigit() or int(pid) == os.getpid():
+            return False
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
@@ -1,8 +1,7 @@
 import math
-from typing import Tuple
-import matplotlib.pyplot as plt
-import matplotlib.cm as cm
-from scipy.stats import spearmanr
+from typing import List, Tuple, Optional, Iterable
+import numpy as np
+from correlation_cache import CorrelationCache, CorrelationCacheEntry
 
 
 def expand_range(value_range: Tuple[float, float], factor: float) -> Tuple[float, float]:
@@ -17,6 +16,25 @@ def wrap_label_multiline(label: str) -> str:
     return label.replace(' (', '\n(')
 
 
+# Number of bins along each axis of a cell, when it is rendered as a density image
+LOD_BIN_COUNT = 64
+
+# Points in density image bins holding at most this number of points are drawn as individual markers
+LOD_OUTLIER_MAX_BIN_COUNT = 1
+
+
+def calc_bin_numbers(values: np.ndarray, value_range: Tuple[float, float], bin_count: int) -> np.ndarray:
+    """Returns the bin number of each value, for equal sized bins covering the value range (-1 for missing values)"""
+    mn, mx = value_range
+    bin_nrs = np.full(len(values), -1, dtype=np.int64)
+    if (mn is None) or (mx is None):
+        return bin_nrs
+    valid = ~np.isnan(values)
+    width = (mx - mn) if mx > mn else 1.0
+    bin_nrs[valid] = np.clip(((values[valid] - mn) / width * bin_count).astype(np.int64), 0, bin_count - 1)
+    return bin_nrs
+
+
 class ColorCategoryManager:
     """Attaches a unique color to each categorical value"""
 
@@ -53,6 +71,9 @@ class CorrelationValue:
     def get_signif_color_fraction(self) -> float:
         """Returns a value between 0 and 1 that can be used for visual color coding of the significance"""
         # @todo: improve & parametrize this currently fairly arbitrary choice
+        if self._p <= 0:
+            # p underflows to 0 for strong correlations over many data points
+            return 1.0
         return min(1.0, -math.log10(self._p) / 15) ** 2
 
 
@@ -86,6 +107,9 @@ class CorrelationFactor:
     def get_range(self) -> Tuple[float, float]:
         return self._range_min, self._range_max
 
+    def set_range(self, value_range: Tuple[float, float]):
+        self._range_min, self._range_max = value_range
+
 
 class CorrelationDataPoint:
     """A single data point in the list of data points driving the correlation gallery"""
@@ -166,7 +190,28 @@ class CorrelationGallery:
         datapoint.set_value_dimy(factor_id, value)
         self._dimy_factors_idx[factor_id].add_value(value)
 
-    def calc_correlations(self):
+    def get_dimx_factors(self) -> List[CorrelationFactor]:
+        return list(self._dimx_factors)
+
+    def get_dimy_factors(self) -> List[CorrelationFactor]:
+        return list(self._dimy_factors)
+
+    def get_corr_matrix(self) -> List[List[CorrelationValue]]:
+        """Returns the correlation values, indexed as [dimx factor nr][dimy factor nr]"""
+        assert self._corr_matrix
+        return self._corr_matrix
+
+    def calc_correlations(self, cache: Optional[CorrelationCache] = None, cache_key: Optional[str] = None):
+        """Calculates the correlation matrix.
+           If a cache is provided, a result stored under the cache key is used instead of recalculating"""
+        if cache is not None:
+            assert cache_key
+            entry = cache.get(cache_key)
+            if entry is not None:
+                self.load_cache_entry(entry)
+                return
+        # scipy.stats is slow to import, so only pay for it when correlations are actually calculated
+        from scipy.stats import spearmanr
         self._corr_matrix = []
         for ix, fac_x in enumerate(self._dimx_factors):
             corr_row = []
@@ -181,6 +226,48 @@ class CorrelationGallery:
                         series_x.append(val_x)
                         series_y.append(val_y)
                 corr_row.append(CorrelationValue(spearmanr(series_x, series_y)))
+        if cache is not None:
+            cache.put(cache_key, self.get_cache_entry())
+
+    def get_cache_entry(self) -> CorrelationCacheEntry:
+        assert self._corr_matrix
+        return CorrelationCacheEntry(
+            dimx_ids=[fac.get_id() for fac in self._dimx_factors],
+            dimx_names=[fac.get_name() for fac in self._dimx_factors],
+            dimx_ranges=[fac.get_range() for fac in self._dimx_factors],
+            dimy_ids=[fac.get_id() for fac in self._dimy_factors],
+            dimy_names=[fac.get_name() for fac in self._dimy_factors],
+            dimy_ranges=[fac.get_range() for fac in self._dimy_factors],
+            r_matrix=np.array([[corr.get_r() for corr in row] for row in self._corr_matrix], dtype=np.float64),
+            p_matrix=np.array([[corr.get_p() for corr in row] for row in self._corr_matrix], dtype=np.float64),
+        )
+
+    def load_cache_entry(self, entry: CorrelationCacheEntry):
+        """Sets the correlation matrix & factor ranges from a cached result.
+           Factors that were not yet added to the gallery are created from the cached ones"""
+        if not self._dimx_factors:
+            for factor_id, name in zip(entry.dimx_ids, entry.dimx_names):
+                self.add_dimx_factor(CorrelationFactor(factor_id, name))
+        if not self._dimy_factors:
+            for factor_id, name in zip(entry.dimy_ids, entry.dimy_names):
+                self.add_dimy_factor(CorrelationFactor(factor_id, name))
+        assert [fac.get_id() for fac in self._dimx_factors] == entry.dimx_ids
+        assert [fac.get_id() for fac in self._dimy_factors] == entry.dimy_ids
+        for fac, value_range in zip(self._dimx_factors, entry.dimx_ranges):
+            fac.set_range(value_range)
+        for fac, value_range in zip(self._dimy_factors, entry.dimy_ranges):
+            fac.set_range(value_range)
+        self._corr_matrix = [
+            [CorrelationValue((float(r), float(p))) for r, p in zip(r_row, p_row)]
+            for r_row, p_row in zip(entry.r_matrix, entry.p_matrix)
+        ]
+
+    @staticmethod
+    def from_cache_entry(entry: CorrelationCacheEntry) -> 'CorrelationGallery':
+        """Creates a gallery holding only the cached factors & correlations, without any data points"""
+        corr_gallery = CorrelationGallery()
+        corr_gallery.load_cache_entry(entry)
+        return corr_gallery
 
     def sort_dimx_by_significance(self, dimy_factor: str):
         assert self._corr_matrix
@@ -190,7 +277,105 @@ class CorrelationGallery:
         staging.sort(key=lambda pt: pt[1][dimy_nr].get_p())
         self._dimx_factors, self._corr_matrix = list(zip(*staging))
 
-    def create_chart(self, show_labels: bool=False, color_by_significance: bool=False):
+    def _prepare_lod_data(self, highlight_points: Optional[Iterable[str]]) -> dict:
+        """Collects all data point values & properties as arrays, once for the entire gallery"""
+        from matplotlib.colors import to_rgb
+        color_cats = list(dict.fromkeys(pt.get_color_cat() for pt in self._datapoints))
+        color_cat_nrs = {cat: nr for nr, cat in enumerate(color_cats)}
+        highlight_points = set(highlight_points or [])
+        lod_data = {
+            'values_x': {
+                fac.get_id(): np.array([
+                    np.nan if pt.get_value_dimx(fac.get_id()) is None else pt.get_value_dimx(fac.get_id())
+                    for pt in self._datapoints
+                ], dtype=np.float64)
+                for fac in self._dimx_factors
+            },
+            'values_y': {
+                fac.get_id(): np.array([
+                    np.nan if pt.get_value_dimy(fac.get_id()) is None else pt.get_value_dimy(fac.get_id())
+                    for pt in self._datapoints
+                ], dtype=np.float64)
+                for fac in self._dimy_factors
+            },
+            'color_cat_nrs': np.array([color_cat_nrs[pt.get_color_cat()] for pt in self._datapoints]),
+            'cat_rgb': np.array([to_rgb(self._color_cat_manager.get_color(cat)) for cat in color_cats]),
+            'sizes': np.array([6 + 60 * math.sqrt(pt.get_size_fraction()) for pt in self._datapoints]),
+            'colors': [self._color_cat_manager.get_color(pt.get_color_cat()) for pt in self._datapoints],
+            'labels': [pt.get_name() for pt in self._datapoints],
+            'highlighted': np.array([pt.get_id() in highlight_points for pt in self._datapoints], dtype=bool),
+        }
+        # Binning of the Y values is shared by all cells in the row
+        lod_data['bins_y'] = {
+            fac.get_id(): calc_bin_numbers(
+                lod_data['values_y'][fac.get_id()], expand_range(fac.get_range(), 0.15), LOD_BIN_COUNT
+            )
+            for fac in self._dimy_factors
+        }
+        return lod_data
+
+    def _draw_lod_cell(
+            self, ax, fac_x: CorrelationFactor, fac_y: CorrelationFactor, bins_x: np.ndarray, lod_data: dict,
+            show_labels: bool
+    ):
+        """Draws a cell as a density image, colored by the mix of color categories in each bin,
+           with individual markers for the highlighted points and the points in sparse bins"""
+        import matplotlib.pyplot as plt
+        range_x = expand_range(fac_x.get_range(), 0.15)
+        range_y = expand_range(fac_y.get_range(), 0.15)
+        if None in range_x or None in range_y:
+            return
+        bins_y = lod_data['bins_y'][fac_y.get_id()]
+        valid = (bins_x >= 0) & (bins_y >= 0)
+        cat_count = len(lod_data['cat_rgb'])
+        flat_bins = bins_x * LOD_BIN_COUNT + bins_y
+        counts = np.bincount(
+            lod_data['color_cat_nrs'][valid] * LOD_BIN_COUNT ** 2 + flat_bins[valid],
+            minlength=cat_count * LOD_BIN_COUNT ** 2
+        ).reshape(cat_count, LOD_BIN_COUNT ** 2)
+        totals = counts.sum(axis=0)
+
+        # Color = count weighted mix of the category colors; opacity grows with the log of the count
+        image = np.zeros((LOD_BIN_COUNT ** 2, 4))
+        filled = totals > 0
+        image[filled, :3] = (counts[:, filled].T @ lod_data['cat_rgb']) / totals[filled, None]
+        if filled.any():
+            image[filled, 3] = 0.2 + 0.7 * np.log1p(totals[filled]) / np.log1p(totals.max())
+        ax.imshow(
+            image.reshape(LOD_BIN_COUNT, LOD_BIN_COUNT, 4).transpose(1, 0, 2),
+            origin='lower', extent=(*range_x, *range_y), aspect='auto', interpolation='nearest'
+        )
+
+        point_nrs = np.nonzero(
+            valid & (lod_data['highlighted'] | (totals[np.where(valid, flat_bins, 0)] <= LOD_OUTLIER_MAX_BIN_COUNT))
+        )[0]
+        ax.scatter(
+            lod_data['values_x'][fac_x.get_id()][point_nrs],
+            lod_data['values_y'][fac_y.get_id()][point_nrs],
+            s=lod_data['sizes'][point_nrs],
+            color=[lod_data['colors'][nr] for nr in point_nrs],
+            alpha=0.5
+        )
+        plt.xlim(range_x)
+        plt.ylim(range_y)
+        if show_labels:
+            plt.rc('font', size=5)
+            for nr in point_nrs:
+                ax.annotate(
+                    lod_data['labels'][nr],
+                    (lod_data['values_x'][fac_x.get_id()][nr], lod_data['values_y'][fac_y.get_id()][nr])
+                )
+
+    def create_chart(
+            self, show_labels: bool=False, color_by_significance: bool=False,
+            lod_point_count: Optional[int]=None, highlight_points: Optional[Iterable[str]]=None
+    ):
+        """Draws the gallery.
+           If there are more data points than lod_point_count, cells are rendered as density images
+           (per color category), and only highlighted points & outliers are drawn as individual markers"""
+        # Deferred, so that compute-only runs never load (or need a display for) the plotting stack
+        import matplotlib.pyplot as plt
+        import matplotlib.cm as cm
         fig = plt.figure()
         color_map = cm.get_cmap('gist_heat')
         plt.axis('off')
@@ -199,9 +384,17 @@ class CorrelationGallery:
         dimy_count = len(self._dimy_factors)
         if color_by_significance:
             assert self._corr_matrix
+        use_lod = (lod_point_count is not None) and (len(self._datapoints) > lod_point_count)
+        if use_lod:
+            lod_data = self._prepare_lod_data(highlight_points)
 
         # draw all scatterplot cells
         for ix, fac_x in enumerate(self._dimx_factors):
+            if use_lod:
+                # Binning of the X values is shared by all cells in the column
+                bins_x = calc_bin_numbers(
+                    lod_data['values_x'][fac_x.get_id()], expand_range(fac_x.get_range(), 0.15), LOD_BIN_COUNT
+                )
             for iy, fac_y in enumerate(self._dimy_factors):
                 plt.rc('font', size=10)
                 ax = fig.add_axes([
@@ -224,6 +417,10 @@ class CorrelationGallery:
                 else:
                     plt.yticks([], [])
 
+                if use_lod:
+                    self._draw_lod_cell(ax, fac_x, fac_y, bins_x, lod_data, show_labels)
+                    continue
+
                 series_x = []
                 series_y = []
                 series_size = []
@@ -18,7 +18,11 @@ def get_epi_metrics_list():
 
 def calc_all_metrics(world_epi_data):
     """Calculate a range of aggregating metrics, and add them to the data"""
-    for country in world_epi_data.get_all_countries():
+    calc_region_metrics(world_epi_data.get_all_countries())
+
+def calc_region_metrics(regions):
+    """Calculate a range of aggregating metrics for a list of countries (or aggregate regions)"""
+    for region in regions:
         for metric in epi_metrics_list:
-            value = metric.calc(country.get_data())
-            country.add_metric(metric.get_id(), value)
\ No newline at end of file
+            value = metric.calc(region.get_data())
+            region.add_metric(metric.get_id(), value)
\ No newline at end of file
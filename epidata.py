@@ -1,59 +1,118 @@
+import array
 import datetime
 import csv
-from typing import Dict, List, Tuple, Optional, Callable
-from constants import DATA_DIR, START_DATE, SECONDS_IN_DAY
+from typing import Dict, List, Tuple, Optional, Callable, Iterable, Iterator, Set, TextIO
+import numpy as np
+from constants import DATA_DIR, START_DATE
 
 
+# Aspect getters, selecting a single column of an EpiDataSeries
 GET_DAILY_CASES = lambda x: x.daily_cases
 GET_DAILY_CASES_FRACTION = lambda x: x.daily_cases_fraction
 GET_DAILY_DEATHS = lambda x: x.daily_deaths
 GET_DAILY_DEATHS_FRACTION = lambda x: x.daily_deaths_fraction
 
-
-class DateEpiData:
-    """A single data point in an epi data time series"""
-
-    def __init__(self, row: Dict[str, str]):
-        """Loads tbe data point from the source file record values"""
-        self.date_string = row['dateRep']
-        self.day = int(row['day'])
-        self.month = int(row['month'])
-        self.year = int(row['year'])
-        self.date = datetime.datetime(self.year, self.month, self.day)
-        self.daily_cases = int(row['cases'])
-        self.daily_deaths = int(row['deaths'])
-        self.elapsed_days = round((self.date - START_DATE).total_seconds() / SECONDS_IN_DAY)
-        self.daily_cases_fraction = None
-        self.daily_deaths_fraction = None
+# Approximate size of the blocks in which the source file is read & parsed
+LOAD_CHUNK_SIZE_BYTES = 4 * 1024 * 1024
+
+
+def accept_raw_line_field(line: str, nr_from_end: int, accepted: Set[str]) -> bool:
+    """Checks a field of a raw csv line against a set of accepted values, without parsing the entire line.
+       The field is located from the end of the line, so that quoted fields before it (e.g. names) do not matter.
+       If quotes occur in or after the field, the line is accepted, and should be checked after parsing"""
+    fields = line.rstrip('\r\n').rsplit(',', nr_from_end + 1)
+    trailing_fields = fields[-(nr_from_end + 1):]
+    if (len(fields) < nr_from_end + 1) or any('"' in field for field in trailing_fields):
+        return True
+    return trailing_fields[0] in accepted
+
+
+def read_raw_record_blocks(csvfile: TextIO, chunk_size_bytes: int) -> Iterator[List[str]]:
+    """Reads the records of a csv file as raw strings, in blocks of approximately chunk_size_bytes.
+       A record normally is a single line, but a quoted field may contain line breaks.
+       Such a record spans several lines, possibly across blocks, and is returned as a single string"""
+    pending = ''
+    while True:
+        lines = csvfile.readlines(chunk_size_bytes)
+        if not lines:
+            break
+        records = []
+        for line in lines:
+            if pending:
+                line = pending + line
+            # An odd number of quotes means that a quoted field continues on the next line
+            if line.count('"') % 2:
+                pending = line
+            else:
+                pending = ''
+                records.append(line)
+        if records:
+            yield records
+    if pending:
+        yield [pending]
 
 
 class EpiDataSeries:
-    """An epi data time series"""
-    def __init__(self):
-        self.data_points: List[DateEpiData] = []
-        self._total_cases: Optional(int) = None
+    """An epi data time series, stored column-wise.
+       While loading, the data points are accumulated in compact typed buffers.
+       `process` converts these to numpy arrays, sorted by date"""
 
-    def add_data_point(self, data_point: DateEpiData):
-        self.data_points.append(data_point)
+    def __init__(self):
+        self._elapsed_days_buffer = array.array('i')
+        self._cases_buffer = array.array('q')
+        self._deaths_buffer = array.array('q')
+        self.elapsed_days: Optional[np.ndarray] = None
+        self.daily_cases: Optional[np.ndarray] = None
+        self.daily_deaths: Optional[np.ndarray] = None
+        self.daily_cases_fraction: Optional[np.ndarray] = None
+        self.daily_deaths_fraction: Optional[np.ndarray] = None
+        self._total_cases: Optional[int] = None
+
+    def add_data_point(self, elapsed_days: int, daily_cases: int, daily_deaths: int):
+        self._elapsed_days_buffer.append(elapsed_days)
+        self._cases_buffer.append(daily_cases)
+        self._deaths_buffer.append(daily_deaths)
 
     def process(self, population_size: float):
+        elapsed_days = np.frombuffer(self._elapsed_days_buffer, dtype=np.int32)
+        order = np.argsort(elapsed_days, kind='stable')
+        self.elapsed_days = elapsed_days[order]
+        self.daily_cases = np.frombuffer(self._cases_buffer, dtype=np.int64)[order]
+        self.daily_deaths = np.frombuffer(self._deaths_buffer, dtype=np.int64)[order]
+        # The sorted arrays are copies, so the load buffers can be released
+        self._elapsed_days_buffer = self._cases_buffer = self._deaths_buffer = None
         if population_size:
-            for point in self.data_points:
-                point.daily_cases_fraction = point.daily_cases / population_size
-                point.daily_deaths_fraction = point.daily_deaths / population_size
-        self.data_points.sort(key=lambda date: date.elapsed_days)
-        assert self.data_points[0].elapsed_days >= 0
-        self._total_cases = sum([pt.daily_cases for pt in self.data_points])
+            self.daily_cases_fraction = self.daily_cases / population_size
+            self.daily_deaths_fraction = self.daily_deaths / population_size
+        assert self.elapsed_days[0] >= 0
+        self._total_cases = int(self.daily_cases.sum())
+
+    @staticmethod
+    def from_arrays(
+            elapsed_days: np.ndarray, daily_cases: np.ndarray, daily_deaths: np.ndarray, population_size: float
+    ) -> 'EpiDataSeries':
+        """Creates a processed series from columns of data point values"""
+        series = EpiDataSeries()
+        series._elapsed_days_buffer = array.array('i', np.asarray(elapsed_days, dtype=np.int32).tobytes())
+        series._cases_buffer = array.array('q', np.asarray(daily_cases, dtype=np.int64).tobytes())
+        series._deaths_buffer = array.array('q', np.asarray(daily_deaths, dtype=np.int64).tobytes())
+        series.process(population_size)
+        return series
 
     def get_total_cases(self) -> int:
         return self._total_cases
 
+    def get_dates(self) -> List[datetime.datetime]:
+        return [START_DATE + datetime.timedelta(days=days) for days in self.elapsed_days.tolist()]
+
     def get_timeseries(self, aspect_getter) -> List[Tuple[datetime.datetime, float]]:
-        return [(point.date, aspect_getter(point)) for point in self.data_points]
+        values = aspect_getter(self)
+        values = values.tolist() if values is not None else [None] * len(self.elapsed_days)
+        return list(zip(self.get_dates(), values))
 
     def log_dump(self):
-        for date in self.data_points:
-            print(f'{date.elapsed_days} {date.date_string} {date.cases} {date.deaths}')
+        for date, cases, deaths in zip(self.get_dates(), self.daily_cases, self.daily_deaths):
+            print(f'{(date - START_DATE).days} {date.strftime("%d/%m/%Y")} {cases} {deaths}')
 
 
 class CountryEpiData:
@@ -81,8 +140,8 @@ class CountryEpiData:
     def get_population_size(self) -> float:
         return self._population_size
 
-    def add_data_row(self, row: Dict[str, str]):
-        self._data.add_data_point(DateEpiData(row))
+    def add_data_point(self, elapsed_days: int, daily_cases: int, daily_deaths: int):
+        self._data.add_data_point(elapsed_days, daily_cases, daily_deaths)
 
     def finalise_load(self):
         self._data.process(self._population_size)
@@ -90,6 +149,11 @@ class CountryEpiData:
     def get_data(self) -> EpiDataSeries:
         return self._data
 
+    def set_data(self, data: EpiDataSeries):
+        """Replaces the (processed) epi data series. Previously calculated metrics are discarded"""
+        self._data = data
+        self._metrics = {}
+
     def has_population_size(self) -> bool:
         return (self._population_size != None) and (self._population_size > 0)
 
@@ -108,25 +172,83 @@ class CountryEpiData:
 class WorldEpiData:
     """Epi data for all countries"""
 
-    def __init__(self, data_file_name: str):
+    def __init__(
+            self, data_file_name: str,
+            continents: Optional[Iterable[str]] = None, country_codes: Optional[Iterable[str]] = None
+    ):
+        """Loads the epi data from a source file.
+           Optionally, only rows for the given continents and/or country codes are loaded.
+           Filtering at load time rejects the other rows on the raw source record, before they are split into fields"""
         self.countries: List[CountryEpiData] = []
         self.countries_idx: Dict[str, CountryEpiData] = dict()
-
-        # load the data from the source file
-        with open(f'{DATA_DIR}/{data_file_name}.csv') as csvfile:
-            csv_reader = csv.DictReader(csvfile, delimiter=',')
-            for row in csv_reader:
-                country_code = row['countryterritoryCode']
-                if country_code not in self.countries_idx:
-                    country = CountryEpiData(
-                        country_code,
-                        row['countriesAndTerritories'],
-                        row['continentExp'],
-                        int(row['popData2019']) if row['popData2019'] else None
-                    )
-                    self.countries_idx[country_code] = country
-                    self.countries.append(country)
-                self.countries_idx[country_code].add_data_row(row)
+        self._source_file = f'{DATA_DIR}/{data_file_name}.csv'
+        self._filter_chain: List[str] = []
+        continents = set(continents) if continents is not None else None
+        country_codes = set(country_codes) if country_codes is not None else None
+        if continents is not None:
+            self._filter_chain.append(f'Load continents {sorted(continents)}')
+            print(f'COUNTRY FILTER STEP: Load only continents {sorted(continents)}')
+        if country_codes is not None:
+            self._filter_chain.append(f'Load country codes {sorted(country_codes)}')
+            print(f'COUNTRY FILTER STEP: Load only country codes {sorted(country_codes)}')
+
+        # load the data from the source file, streaming it in blocks of records
+        # rows are parsed as plain lists, using the column numbers from the header
+        with open(self._source_file, newline='') as csvfile:
+            header = next(csv.reader([csvfile.readline()], delimiter=','))
+            col_nr = {name: nr for nr, name in enumerate(header)}
+            col_day, col_month, col_year = col_nr['day'], col_nr['month'], col_nr['year']
+            col_cases, col_deaths = col_nr['cases'], col_nr['deaths']
+            col_code, col_name = col_nr['countryterritoryCode'], col_nr['countriesAndTerritories']
+            col_continent, col_population = col_nr['continentExp'], col_nr['popData2019']
+            # Load filters that are checked on the raw records: (column nr counted from the end, accepted values)
+            raw_line_filters = [
+                (len(header) - 1 - col, accepted)
+                for col, accepted in [(col_continent, continents), (col_code, country_codes)]
+                if accepted is not None
+            ]
+            # Only a few hundred different dates occur, so parsing them once saves a lot of work
+            elapsed_days_idx: Dict[Tuple[str, str, str], int] = {}
+            start_ordinal = START_DATE.toordinal()
+            for records in read_raw_record_blocks(csvfile, LOAD_CHUNK_SIZE_BYTES):
+                if raw_line_filters:
+                    records = [
+                        record for record in records
+                        if all(
+                            accept_raw_line_field(record, nr_from_end, accepted)
+                            for nr_from_end, accepted in raw_line_filters
+                        )
+                    ]
+                for row in csv.reader(records, delimiter=','):
+                    if not row:
+                        # Blank line
+                        continue
+                    if len(row) != len(header):
+                        raise Exception(f'Invalid row in {self._source_file}: expected {len(header)} fields, found {row}')
+                    # Repeated here, for the records that could not be checked reliably in raw form
+                    if (continents is not None) and (row[col_continent] not in continents):
+                        continue
+                    country_code = row[col_code]
+                    if (country_codes is not None) and (country_code not in country_codes):
+                        continue
+                    country = self.countries_idx.get(country_code)
+                    if country is None:
+                        country = CountryEpiData(
+                            country_code,
+                            row[col_name],
+                            row[col_continent],
+                            int(row[col_population]) if row[col_population] else None
+                        )
+                        self.countries_idx[country_code] = country
+                        self.countries.append(country)
+                    date_key = (row[col_day], row[col_month], row[col_year])
+                    elapsed_days = elapsed_days_idx.get(date_key)
+                    if elapsed_days is None:
+                        elapsed_days = datetime.date(
+                            int(date_key[2]), int(date_key[1]), int(date_key[0])
+                        ).toordinal() - start_ordinal
+                        elapsed_days_idx[date_key] = elapsed_days
+                    country.add_data_point(elapsed_days, int(row[col_cases]), int(row[col_deaths]))
         for country in self.countries:
             country.finalise_load()
 
@@ -139,6 +261,7 @@ class WorldEpiData:
             else:
                 rejected.append(country)
         self.countries = accepted
+        self._filter_chain.append(reason)
         print(f'COUNTRY FILTER STEP: {reason}; Removed:{[r.get_name() for r in rejected]}')
 
     def filter_min_total_cases(self, min_total_cases: int):
@@ -160,6 +283,13 @@ class WorldEpiData:
             f'Restrict to continent {continent}'
         )
 
+    def get_source_file(self) -> str:
+        return self._source_file
+
+    def get_filter_chain(self) -> List[str]:
+        """Returns the descriptions of all filters applied so far, in order"""
+        return list(self._filter_chain)
+
     def get_country(self, country_code: str) -> CountryEpiData:
         if country_code not in self.countries_idx:
             raise Exception(f'Invalid country code {country_code}')
@@ -48,6 +48,7 @@ class GeoRegionsIndicator:
                 filename_metadata = item.name
         assert filename_datafile
         assert filename_metadata
+        self._source_files = [f'{indicator_dir}/{filename_datafile}', f'{indicator_dir}/{filename_metadata}']
 
         # Load & parse the metadata
         with open(f'{indicator_dir}/{filename_metadata}') as csvfile:
@@ -105,6 +106,9 @@ class GeoRegionsIndicator:
     def get_name(self) -> str:
         return self._indicator_name
 
+    def get_source_files(self) -> List[str]:
+        return list(self._source_files)
+
     def get_region_value(self, region_code: str) -> Optional[float]:
         if region_code not in self._regions_idx:
             return None
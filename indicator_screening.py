@@ -0,0 +1,219 @@
+import heapq
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from epidata import CountryEpiData
+from georegions_indicators import GeoRegionsIndicator
+from correlation_gallery import CorrelationValue
+
+"""
+Screening for redundant & collinear indicators: Spearman correlations between all pairs of indicators.
+The (indicator x indicator) matrix is calculated in blocks of columns, spread over multiple processes,
+and only the most correlated pairs are retained, so that memory use is bounded for many indicators.
+Each pair uses the regions where both indicators have a value (pairwise complete).
+"""
+
+
+DEFAULT_BLOCK_SIZE = 64
+
+# Minimum number of regions with values for both indicators, for a pair to be considered
+DEFAULT_MIN_OVERLAP = 10
+
+# A pair, as returned by the block calculations: column nr a, column nr b, r, p, region count
+PairResult = Tuple[int, int, float, float, int]
+
+
+class IndicatorPairCorrelation:
+    """The correlation between two indicators"""
+
+    def __init__(self, indicator_id_a: str, indicator_id_b: str, corr: CorrelationValue, region_count: int):
+        self._indicator_id_a = indicator_id_a
+        self._indicator_id_b = indicator_id_b
+        self._corr = corr
+        self._region_count = region_count
+
+    def get_indicator_ids(self) -> Tuple[str, str]:
+        return self._indicator_id_a, self._indicator_id_b
+
+    def get_correlation(self) -> CorrelationValue:
+        return self._corr
+
+    def get_region_count(self) -> int:
+        return self._region_count
+
+
+def build_indicator_matrix(
+        indicators: List[GeoRegionsIndicator], regions: List[CountryEpiData],
+        indicator_value_getter: Optional[Callable[[GeoRegionsIndicator, CountryEpiData], Optional[float]]] = None
+) -> np.ndarray:
+    """Returns a (region x indicator) matrix of values, with NaN for missing values"""
+    if indicator_value_getter is None:
+        indicator_value_getter = lambda indicator, region: indicator.get_region_value(region.get_code())
+    values = np.full((len(regions), len(indicators)), np.nan, dtype=np.float64)
+    for col_nr, indicator in enumerate(indicators):
+        for row_nr, region in enumerate(regions):
+            value = indicator_value_getter(indicator, region)
+            if value is not None:
+                values[row_nr, col_nr] = value
+    return values
+
+
+def _masked_ranks(values: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Average ranks along the columns, counting only the masked entries (other entries get meaningless ranks)"""
+    from scipy.stats import rankdata
+    return rankdata(np.where(mask, values, np.inf), axis=0)
+
+
+def _calc_p_values(r: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Two-sided p values of Spearman r values, using the same t distribution approximation as scipy's spearmanr"""
+    from scipy.stats import t as t_distribution
+    dof = counts - 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = r * np.sqrt(dof / ((1.0 - r) * (1.0 + r)))
+    return 2 * t_distribution.sf(np.abs(t), dof)
+
+
+def _select_pairs(
+        rows: np.ndarray, cols: np.ndarray, r: np.ndarray, p: np.ndarray, counts: np.ndarray,
+        top_k: Optional[int], min_abs_r: Optional[float]
+) -> List[PairResult]:
+    """Keeps the pairs of a block that can still end up in the final result:
+       above the threshold, and in the block-local top k of either of both indicators"""
+    abs_r = np.abs(r)
+    keep = np.isfinite(r)
+    if min_abs_r is not None:
+        keep &= abs_r >= min_abs_r
+    if top_k is not None:
+        ranked = np.where(keep, abs_r, -1.0)
+        in_top = np.zeros(r.shape, dtype=bool)
+        for axis in [0, 1]:
+            k = min(top_k, r.shape[axis])
+            top_nrs = np.argsort(-ranked, axis=axis, kind='stable').take(np.arange(k), axis=axis)
+            np.put_along_axis(in_top, top_nrs, True, axis=axis)
+        keep &= in_top
+    row_nrs, col_nrs = np.nonzero(keep)
+    return [
+        (int(rows[i]), int(cols[j]), float(r[i, j]), float(p[i, j]), int(counts[i, j]))
+        for i, j in zip(row_nrs, col_nrs)
+    ]
+
+
+# Value matrix shared with the worker processes, set once per process
+_worker_values: Optional[np.ndarray] = None
+
+
+def _init_worker(values: np.ndarray):
+    global _worker_values
+    _worker_values = values
+
+
+def _calc_block_pair(task) -> List[PairResult]:
+    """Calculates the correlations between two blocks of columns of the shared value matrix"""
+    (start_a, end_a), (start_b, end_b), min_overlap, top_k, min_abs_r = task
+    values_a = _worker_values[:, start_a:end_a]
+    values_b = _worker_values[:, start_b:end_b]
+    valid_a = ~np.isnan(values_a)
+    valid_b = ~np.isnan(values_b)
+    r = np.full((end_a - start_a, end_b - start_b), np.nan)
+    counts = np.zeros(r.shape, dtype=np.int64)
+    for nr_a in range(end_a - start_a):
+        # All columns of block b, restricted to the regions where both indicators have a value
+        mask = valid_a[:, nr_a:nr_a + 1] & valid_b
+        count = mask.sum(axis=0)
+        ranks_a = _masked_ranks(np.broadcast_to(values_a[:, nr_a:nr_a + 1], mask.shape), mask)
+        ranks_b = _masked_ranks(values_b, mask)
+        # Average ranks of n values always have mean (n + 1) / 2
+        mean_rank = (count + 1) / 2
+        centered_a = np.where(mask, ranks_a - mean_rank, 0.0)
+        centered_b = np.where(mask, ranks_b - mean_rank, 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r[nr_a] = (centered_a * centered_b).sum(axis=0) / np.sqrt(
+                (centered_a ** 2).sum(axis=0) * (centered_b ** 2).sum(axis=0))
+        counts[nr_a] = count
+    rows = np.arange(start_a, end_a)
+    cols = np.arange(start_b, end_b)
+    r[counts < max(min_overlap, 3)] = np.nan
+    if start_a == start_b:
+        # Diagonal block: only keep each pair once, and skip self correlations
+        r[np.tril_indices(r.shape[0], m=r.shape[1])] = np.nan
+    r = np.clip(r, -1.0, 1.0)
+    p = _calc_p_values(r, counts)
+    return _select_pairs(rows, cols, r, p, counts, top_k, min_abs_r)
+
+
+def screen_indicator_matrix(
+        values: np.ndarray, top_k: Optional[int] = None, min_abs_r: Optional[float] = None,
+        min_overlap: int = DEFAULT_MIN_OVERLAP, block_size: int = DEFAULT_BLOCK_SIZE,
+        worker_count: Optional[int] = None
+) -> List[PairResult]:
+    """Screens all column pairs of a (region x indicator) matrix.
+       Returns, for each indicator, the top k most correlated pairs (by absolute r) and/or all pairs above a threshold.
+       Results are sorted by decreasing absolute r"""
+    assert (top_k is not None) or (min_abs_r is not None)
+    indicator_count = values.shape[1]
+    blocks = [(start, min(start + block_size, indicator_count)) for start in range(0, indicator_count, block_size)]
+    tasks = [
+        (blocks[block_nr_a], blocks[block_nr_b], min_overlap, top_k, min_abs_r)
+        for block_nr_a in range(len(blocks))
+        for block_nr_b in range(block_nr_a, len(blocks))
+    ]
+    worker_count = worker_count or os.cpu_count() or 1
+
+    # For each indicator, a min-heap holding its top k pairs so far.
+    # A pair is retained as long as it is in the heap of at least one of both indicators
+    top_pairs: Dict[int, list] = {}
+    heap_counts: Dict[Tuple[int, int], int] = {}
+    selected: Dict[Tuple[int, int], PairResult] = {}
+
+    def collect(block_pairs: List[PairResult]):
+        for pair in block_pairs:
+            key = (pair[0], pair[1])
+            if top_k is None:
+                selected[key] = pair
+                continue
+            entry = (abs(pair[2]), key)
+            for indicator_nr in key:
+                heap = top_pairs.setdefault(indicator_nr, [])
+                if len(heap) < top_k:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    evicted_key = heapq.heapreplace(heap, entry)[1]
+                    heap_counts[evicted_key] -= 1
+                    if heap_counts[evicted_key] == 0:
+                        del heap_counts[evicted_key]
+                        del selected[evicted_key]
+                else:
+                    continue
+                selected[key] = pair
+                heap_counts[key] = heap_counts.get(key, 0) + 1
+
+    if worker_count == 1 or len(tasks) == 1:
+        _init_worker(values)
+        for task in tasks:
+            collect(_calc_block_pair(task))
+    else:
+        with ProcessPoolExecutor(max_workers=worker_count, initializer=_init_worker, initargs=(values,)) as executor:
+            for block_pairs in executor.map(_calc_block_pair, tasks):
+                collect(block_pairs)
+
+    return sorted(selected.values(), key=lambda pair: -abs(pair[2]))
+
+
+def screen_indicators(
+        indicators: List[GeoRegionsIndicator], regions: List[CountryEpiData],
+        indicator_value_getter: Optional[Callable[[GeoRegionsIndicator, CountryEpiData], Optional[float]]] = None,
+        top_k: Optional[int] = None, min_abs_r: Optional[float] = None,
+        min_overlap: int = DEFAULT_MIN_OVERLAP, block_size: int = DEFAULT_BLOCK_SIZE,
+        worker_count: Optional[int] = None
+) -> List[IndicatorPairCorrelation]:
+    """Finds the most correlated pairs of indicators, using the given regions as data points"""
+    values = build_indicator_matrix(indicators, regions, indicator_value_getter)
+    pairs = screen_indicator_matrix(values, top_k, min_abs_r, min_overlap, block_size, worker_count)
+    print(f'INDICATOR SCREENING: {len(indicators)} indicators; {len(pairs)} correlated pairs retained')
+    return [
+        IndicatorPairCorrelation(
+            indicators[nr_a].get_id(), indicators[nr_b].get_id(), CorrelationValue((r, p)), count
+        )
+        for nr_a, nr_b, r, p, count in pairs
+    ]
@@ -0,0 +1,196 @@
+from typing import Dict, List, Optional
+import numpy as np
+from epidata import WorldEpiData, CountryEpiData, EpiDataSeries
+from georegions_indicators import GeoRegionsIndicator
+
+"""
+Hierarchical roll-ups of the country epi data: world -> continents -> countries.
+The aggregate series of all levels are precomputed bottom-up as dense (region x day) matrices,
+and kept up to date incrementally when the series of a country changes.
+Aggregate regions behave as CountryEpiData, so that they can be used to calculate metrics on,
+and as data points in a correlation gallery.
+"""
+
+
+LEVEL_WORLD = 'world'
+LEVEL_CONTINENT = 'continent'
+LEVEL_COUNTRY = 'country'
+
+# All levels, from top to bottom
+REGION_LEVELS = [LEVEL_WORLD, LEVEL_CONTINENT, LEVEL_COUNTRY]
+
+# Uses the same code as the World Bank world aggregate
+WORLD_REGION_CODE = 'WLD'
+WORLD_REGION_NAME = 'World'
+
+
+class RegionEpiData(CountryEpiData):
+    """Epi data aggregated over all countries below a node of the region hierarchy.
+       The time series is built on demand from the precomputed sums of the hierarchy"""
+
+    def __init__(
+            self, hierarchy: 'RegionHierarchy', level: str, row_nr: int,
+            code: str, name: str, continent: str, population_size: float, children: List[CountryEpiData]
+    ):
+        super().__init__(code, name, continent, population_size)
+        self._hierarchy = hierarchy
+        self._level = level
+        self._row_nr = row_nr
+        self._children = children
+        self._data = None
+
+    def get_level(self) -> str:
+        return self._level
+
+    def get_children(self) -> List[CountryEpiData]:
+        return self._children
+
+    def get_data(self) -> EpiDataSeries:
+        if self._data is None:
+            self._data = self._hierarchy.build_series(self._level, self._row_nr, self._population_size)
+        return self._data
+
+    def invalidate(self):
+        """Discards the aggregate series & metrics, after a change in one of the underlying countries"""
+        self._data = None
+        self._metrics = {}
+
+
+class RegionHierarchy:
+    """World, continent & country level epi data, built on the (filtered) countries of a WorldEpiData"""
+
+    def __init__(self, world_epi_data: WorldEpiData):
+        self._countries = []
+        for country in world_epi_data.get_all_countries():
+            if country.has_population_size():
+                self._countries.append(country)
+            else:
+                print(f'WARNING: {country.get_name()} is left out of the region aggregates (no population size)')
+        assert self._countries
+        self._country_row_idx = {country.get_code(): nr for nr, country in enumerate(self._countries)}
+        continent_names = list(dict.fromkeys(country.get_continent() for country in self._countries))
+        continent_row_idx = {name: nr for nr, name in enumerate(continent_names)}
+
+        # For each level below the top, the row number of the parent of each region
+        self._parent_row_nrs: Dict[str, np.ndarray] = {
+            LEVEL_COUNTRY: np.array([continent_row_idx[country.get_continent()] for country in self._countries]),
+            LEVEL_CONTINENT: np.zeros(len(continent_names), dtype=np.int64),
+        }
+        self._parent_level = {LEVEL_COUNTRY: LEVEL_CONTINENT, LEVEL_CONTINENT: LEVEL_WORLD}
+
+        # Dense (region x day) matrices of daily cases, daily deaths & number of reported data points, per level
+        self._day_count = 1 + max(int(country.get_data().elapsed_days[-1]) for country in self._countries)
+        self._cases: Dict[str, np.ndarray] = {}
+        self._deaths: Dict[str, np.ndarray] = {}
+        self._reported: Dict[str, np.ndarray] = {}
+        self._cases[LEVEL_COUNTRY] = np.zeros((len(self._countries), self._day_count), dtype=np.int64)
+        self._deaths[LEVEL_COUNTRY] = np.zeros((len(self._countries), self._day_count), dtype=np.int64)
+        self._reported[LEVEL_COUNTRY] = np.zeros((len(self._countries), self._day_count), dtype=np.int64)
+        for row_nr, country in enumerate(self._countries):
+            self._set_country_row(row_nr, country.get_data())
+        populations = np.array([country.get_population_size() for country in self._countries], dtype=np.float64)
+
+        # Sum up all levels, bottom-up, in a single pass per level
+        self._populations = {LEVEL_COUNTRY: populations}
+        for child_level, parent_count in [(LEVEL_COUNTRY, len(continent_names)), (LEVEL_CONTINENT, 1)]:
+            parent_level = self._parent_level[child_level]
+            parent_row_nrs = self._parent_row_nrs[child_level]
+            for sums in [self._cases, self._deaths, self._reported]:
+                sums[parent_level] = np.zeros((parent_count, self._day_count), dtype=np.int64)
+                np.add.at(sums[parent_level], parent_row_nrs, sums[child_level])
+            self._populations[parent_level] = np.zeros(parent_count, dtype=np.float64)
+            np.add.at(self._populations[parent_level], parent_row_nrs, self._populations[child_level])
+
+        # Create the aggregate regions
+        continent_regions = [
+            RegionEpiData(
+                self, LEVEL_CONTINENT, row_nr, name, name, name,
+                float(self._populations[LEVEL_CONTINENT][row_nr]),
+                [country for country in self._countries if country.get_continent() == name]
+            )
+            for row_nr, name in enumerate(continent_names)
+        ]
+        world_region = RegionEpiData(
+            self, LEVEL_WORLD, 0, WORLD_REGION_CODE, WORLD_REGION_NAME, WORLD_REGION_NAME,
+            float(self._populations[LEVEL_WORLD][0]), continent_regions
+        )
+        self._regions: Dict[str, list] = {
+            LEVEL_WORLD: [world_region],
+            LEVEL_CONTINENT: continent_regions,
+            LEVEL_COUNTRY: self._countries,
+        }
+        self._indicator_values: Dict[tuple, Optional[float]] = {}
+
+    def _ensure_day_count(self, day_count: int):
+        if day_count <= self._day_count:
+            return
+        for sums in [self._cases, self._deaths, self._reported]:
+            for level in REGION_LEVELS:
+                sums[level] = np.pad(sums[level], ((0, 0), (0, day_count - self._day_count)))
+        self._day_count = day_count
+
+    def _set_country_row(self, row_nr: int, data: EpiDataSeries):
+        for sums in [self._cases, self._deaths, self._reported]:
+            sums[LEVEL_COUNTRY][row_nr, :] = 0
+        np.add.at(self._cases[LEVEL_COUNTRY][row_nr], data.elapsed_days, data.daily_cases)
+        np.add.at(self._deaths[LEVEL_COUNTRY][row_nr], data.elapsed_days, data.daily_deaths)
+        np.add.at(self._reported[LEVEL_COUNTRY][row_nr], data.elapsed_days, 1)
+
+    def update_country(self, country: CountryEpiData):
+        """Updates all aggregates above a country, after its epi data series has changed.
+           Only the regions containing the country are recalculated"""
+        row_nr = self._country_row_idx[country.get_code()]
+        self._ensure_day_count(1 + int(country.get_data().elapsed_days[-1]))
+        old_rows = [sums[LEVEL_COUNTRY][row_nr].copy() for sums in [self._cases, self._deaths, self._reported]]
+        self._set_country_row(row_nr, country.get_data())
+        deltas = [
+            sums[LEVEL_COUNTRY][row_nr] - old_row
+            for sums, old_row in zip([self._cases, self._deaths, self._reported], old_rows)
+        ]
+        self._indicator_values = {}
+        level = LEVEL_COUNTRY
+        while level in self._parent_level:
+            row_nr = int(self._parent_row_nrs[level][row_nr])
+            level = self._parent_level[level]
+            for sums, delta in zip([self._cases, self._deaths, self._reported], deltas):
+                sums[level][row_nr] += delta
+            self._regions[level][row_nr].invalidate()
+
+    def build_series(self, level: str, row_nr: int, population_size: float) -> EpiDataSeries:
+        """Returns the aggregate time series of a region, covering all days where any of its countries reported data"""
+        elapsed_days = np.nonzero(self._reported[level][row_nr])[0]
+        return EpiDataSeries.from_arrays(
+            elapsed_days,
+            self._cases[level][row_nr, elapsed_days],
+            self._deaths[level][row_nr, elapsed_days],
+            population_size
+        )
+
+    def get_level_regions(self, level: str) -> List[CountryEpiData]:
+        assert level in self._regions
+        return self._regions[level]
+
+    def get_all_regions(self) -> List[CountryEpiData]:
+        return [region for level in REGION_LEVELS for region in self._regions[level]]
+
+    def get_leaf_countries(self, region: CountryEpiData) -> List[CountryEpiData]:
+        if not isinstance(region, RegionEpiData):
+            return [region]
+        return [country for child in region.get_children() for country in self.get_leaf_countries(child)]
+
+    def get_indicator_value(self, indicator: GeoRegionsIndicator, region: CountryEpiData) -> Optional[float]:
+        """Returns the indicator value of a region.
+           For aggregate regions, this is the population weighted mean of the (transformed) country values"""
+        if not isinstance(region, RegionEpiData):
+            return indicator.get_region_value(region.get_code())
+        key = (indicator.get_id(), region.get_code())
+        if key not in self._indicator_values:
+            weighted_sum = 0.0
+            weight_sum = 0.0
+            for country in self.get_leaf_countries(region):
+                value = indicator.get_region_value(country.get_code())
+                if value is not None:
+                    weighted_sum += value * country.get_population_size()
+                    weight_sum += country.get_population_size()
+            self._indicator_values[key] = weighted_sum / weight_sum if weight_sum > 0 else None
+        return self._indicator_values[key]
@@ -0,0 +1,42 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from columnar_export import write_columnar_table, ColumnarTable
+
+
+class TestColumnarExport(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self.table_dir = f'{self._temp_dir.name}/table'
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def test_roundtrip(self):
+        write_columnar_table(self.table_dir, {
+            'Code': np.array(['AAA', 'BB'], dtype=str),
+            'Value': np.array([1.5, np.nan]),
+            'Matrix': np.arange(6, dtype=np.float64).reshape(2, 3),
+        }, {'info': 'test'})
+        table = ColumnarTable(self.table_dir)
+        self.assertEqual(table.get_row_count(), 2)
+        self.assertEqual(table.get_column_names(), ['Code', 'Value', 'Matrix'])
+        self.assertEqual(table.get_attributes(), {'info': 'test'})
+        self.assertEqual(table.get_column('Code').tolist(), ['AAA', 'BB'])
+        self.assertIsInstance(table.get_column('Value'), np.memmap)
+        np.testing.assert_array_equal(table.get_column('Matrix'), np.arange(6).reshape(2, 3))
+
+    def test_overwrite_removes_old_columns(self):
+        write_columnar_table(self.table_dir, {f'Col{nr}': np.zeros(3) for nr in range(4)})
+        write_columnar_table(self.table_dir, {'Code': np.array(['A'], dtype=str)})
+        self.assertEqual(sorted(os.listdir(self.table_dir)), ['col_0.npy', 'schema.json'])
+        self.assertEqual(sorted(os.listdir(self._temp_dir.name)), ['table'])
+        table = ColumnarTable(self.table_dir)
+        self.assertEqual(table.get_column_names(), ['Code'])
+        self.assertEqual(table.get_column('Code').tolist(), ['A'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from correlation_cache import CorrelationCache, CorrelationCacheEntry, calc_cache_key
+
+
+def make_entry() -> CorrelationCacheEntry:
+    return CorrelationCacheEntry(
+        dimx_ids=['X1', 'X2'], dimx_names=['X 1', 'X 2'], dimx_ranges=[(0.0, 1.0), (None, None)],
+        dimy_ids=['Y1'], dimy_names=['Y 1'], dimy_ranges=[(-1.0, 2.0)],
+        r_matrix=np.array([[0.5], [0.25]]), p_matrix=np.array([[0.01], [0.2]])
+    )
+
+
+class TestCorrelationCache(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = self._temp_dir.name
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def test_roundtrip(self):
+        cache = CorrelationCache(self.cache_dir)
+        cache.put('abc', make_entry())
+        entry = cache.get('abc')
+        self.assertEqual(entry.dimx_ids, ['X1', 'X2'])
+        self.assertEqual(entry.dimx_ranges, [(0.0, 1.0), (None, None)])
+        np.testing.assert_array_equal(entry.r_matrix, [[0.5], [0.25]])
+        self.assertIsNone(cache.get('missing'))
+
+    def test_bad_entries_are_discarded(self):
+        cache = CorrelationCache(self.cache_dir)
+        cache.put('good', make_entry())
+        with open(f'{self.cache_dir}/good.npz', 'rb') as cache_file:
+            good_content = cache_file.read()
+        bad_contents = {
+            'truncated': good_content[:len(good_content) // 2],
+            'garbage': b'PK' + b'\x00' * 100,
+            'empty': b'',
+        }
+        for key, content in bad_contents.items():
+            file_name = f'{self.cache_dir}/{key}.npz'
+            with open(file_name, 'wb') as cache_file:
+                cache_file.write(content)
+            self.assertIsNone(cache.get(key), key)
+            self.assertFalse(os.path.exists(file_name), key)
+
+    def test_evict(self):
+        cache = CorrelationCache(self.cache_dir)
+        cache.put('first', make_entry())
+        entry_size = os.path.getsize(f'{self.cache_dir}/first.npz')
+        # A temporary file left behind by a crashed process
+        with open(f'{self.cache_dir}/other.npz.999999999.tmp', 'wb') as temp_file:
+            temp_file.write(b'partial')
+        cache = CorrelationCache(self.cache_dir, max_size_bytes=entry_size)
+        cache.put('second', make_entry())
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), ['second.npz'])
+
+    def test_cache_key_covers_datapoints(self):
+        source_file = f'{self.cache_dir}/source.csv'
+        with open(source_file, 'w') as csvfile:
+            csvfile.write('data')
+
+        def get_key(datapoint_ids):
+            return calc_cache_key([source_file], ['Minimum population: 1000'], datapoint_ids, ['X1'], ['Y1'])
+
+        key = get_key(['AFG', 'BEL', 'CHN'])
+        self.assertEqual(key, get_key(['AFG', 'BEL', 'CHN']))
+        # Same filter description, but a different filter outcome or order of the data points
+        self.assertNotEqual(key, get_key(['AFG', 'BEL']))
+        self.assertNotEqual(key, get_key(['BEL', 'AFG', 'CHN']))
+
+
+if __name__ == '__main__':
+    unittest.main()
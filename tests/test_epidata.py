@@ -0,0 +1,87 @@
+import tempfile
+import unittest
+from unittest import mock
+from epidata import WorldEpiData, accept_raw_line_field, LOAD_CHUNK_SIZE_BYTES
+
+
+HEADER = 'dateRep,day,month,year,cases,deaths,countriesAndTerritories,geoId,countryterritoryCode,popData2019,continentExp\n'
+
+
+class TestRawLineFilter(unittest.TestCase):
+
+    def test_last_field(self):
+        line = '26/06/2020,26,6,2020,460,36,Afghanistan,AF,AFG,38041757,Asia\r\n'
+        self.assertTrue(accept_raw_line_field(line, 0, {'Asia'}))
+        self.assertFalse(accept_raw_line_field(line, 0, {'Africa'}))
+        self.assertTrue(accept_raw_line_field(line, 2, {'AFG'}))
+        self.assertFalse(accept_raw_line_field(line, 2, {'BEL'}))
+
+    def test_quoted_field_before(self):
+        line = '26/06/2020,26,6,2020,0,0,"Bonaire, Saint Eustatius and Saba",BQ,BES,25983,America\n'
+        self.assertTrue(accept_raw_line_field(line, 2, {'BES'}))
+        self.assertFalse(accept_raw_line_field(line, 0, {'Asia'}))
+
+    def test_quoted_field_after_is_accepted(self):
+        line = '26/06/2020,26,6,2020,0,0,Name,BQ,BES,25983,"Some, continent"\n'
+        self.assertTrue(accept_raw_line_field(line, 2, {'AFG'}))
+
+
+class TestWorldEpiDataLoad(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._data_dir_patch = mock.patch('epidata.DATA_DIR', self._temp_dir.name)
+        self._data_dir_patch.start()
+
+    def tearDown(self):
+        self._data_dir_patch.stop()
+        self._temp_dir.cleanup()
+
+    def write_data_file(self, content: str):
+        with open(f'{self._temp_dir.name}/cases.csv', 'w', newline='') as csvfile:
+            csvfile.write(HEADER + content)
+
+    def test_blank_lines_are_skipped(self):
+        self.write_data_file(
+            '26/06/2020,26,6,2020,460,36,Afghanistan,AF,AFG,38041757,Asia\n'
+            '\n'
+            '25/06/2020,25,6,2020,234,21,Afghanistan,AF,AFG,38041757,Asia\n'
+        )
+        for continents in [None, ['Asia']]:
+            world_epi_data = WorldEpiData('cases', continents=continents)
+            data = world_epi_data.get_country('AFG').get_data()
+            self.assertEqual(data.daily_cases.tolist(), [234, 460])
+
+    def test_multi_line_records(self):
+        self.write_data_file(
+            '26/06/2020,26,6,2020,0,0,"Bonaire,\nSaint Eustatius\nand Saba",BQ,BES,25983,America\n'
+            '26/06/2020,26,6,2020,460,36,Afghanistan,AF,AFG,38041757,Asia\n'
+            '25/06/2020,25,6,2020,1,0,"Bonaire,\nSaint Eustatius\nand Saba",BQ,BES,25983,America\n'
+            '25/06/2020,25,6,2020,234,21,Afghanistan,AF,AFG,38041757,Asia\n'
+        )
+        # Reading a single line at a time, the records are split across blocks
+        for chunk_size_bytes in [1, LOAD_CHUNK_SIZE_BYTES]:
+            with mock.patch('epidata.LOAD_CHUNK_SIZE_BYTES', chunk_size_bytes):
+                for continents in [None, ['America'], ['Asia']]:
+                    world_epi_data = WorldEpiData('cases', continents=continents)
+                    expected_codes = {None: ['BES', 'AFG'], 'America': ['BES'], 'Asia': ['AFG']}
+                    self.assertEqual(
+                        [country.get_code() for country in world_epi_data.get_all_countries()],
+                        expected_codes[continents[0] if continents else None]
+                    )
+                    if continents != ['Asia']:
+                        country = world_epi_data.get_country('BES')
+                        self.assertEqual(country.get_name(), 'Bonaire,\nSaint Eustatius\nand Saba')
+                        self.assertEqual(country.get_data().daily_cases.tolist(), [1, 0])
+
+    def test_short_row(self):
+        self.write_data_file(
+            '26/06/2020,26,6,2020,460,36,Afghanistan,AF,AFG,38041757,Asia\n'
+            '25/06/2020,25,6,2020,234\n'
+        )
+        with self.assertRaisesRegex(Exception, 'expected 11 fields'):
+            WorldEpiData('cases')
+
+
+if __name__ == '__main__':
+    unittest.main()
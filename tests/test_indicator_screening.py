@@ -0,0 +1,77 @@
+import unittest
+import numpy as np
+from scipy.stats import spearmanr
+from indicator_screening import screen_indicator_matrix
+
+
+MIN_OVERLAP = 10
+
+
+def make_values(region_count: int, indicator_count: int, seed: int) -> np.ndarray:
+    """Indicators sharing a few latent factors, rounded to get ties, with missing values"""
+    rng = np.random.default_rng(seed)
+    factors = rng.normal(size=(region_count, 3))
+    values = factors @ rng.normal(size=(3, indicator_count)) + rng.normal(size=(region_count, indicator_count))
+    values = np.round(values, 1)
+    values[rng.random(values.shape) < 0.2] = np.nan
+    return values
+
+
+def calc_brute_force(values: np.ndarray) -> dict:
+    """Spearman correlations of all column pairs, on the pairwise complete regions, using scipy"""
+    pairs = {}
+    for nr_a in range(values.shape[1]):
+        for nr_b in range(nr_a + 1, values.shape[1]):
+            mask = ~np.isnan(values[:, nr_a]) & ~np.isnan(values[:, nr_b])
+            if mask.sum() >= MIN_OVERLAP:
+                r, p = spearmanr(values[mask, nr_a], values[mask, nr_b])
+                pairs[(nr_a, nr_b)] = (r, p, int(mask.sum()))
+    return pairs
+
+
+class TestIndicatorScreening(unittest.TestCase):
+
+    def test_matches_spearmanr(self):
+        values = make_values(30, 6, seed=1)
+        self.assertTrue(np.isnan(values).any())
+        expected = calc_brute_force(values)
+        pairs = screen_indicator_matrix(values, min_abs_r=0.0, min_overlap=MIN_OVERLAP, worker_count=1)
+        self.assertEqual(sorted((nr_a, nr_b) for nr_a, nr_b, _, _, _ in pairs), sorted(expected))
+        for nr_a, nr_b, r, p, count in pairs:
+            expected_r, expected_p, expected_count = expected[(nr_a, nr_b)]
+            self.assertAlmostEqual(r, expected_r, places=10)
+            self.assertAlmostEqual(p, expected_p, places=10)
+            self.assertEqual(count, expected_count)
+        abs_r = [abs(pair[2]) for pair in pairs]
+        self.assertEqual(abs_r, sorted(abs_r, reverse=True))
+
+    def test_top_k_matches_brute_force(self):
+        values = make_values(40, 14, seed=2)
+        expected = calc_brute_force(values)
+        top_k = 3
+        expected_keys = set()
+        for indicator_nr in range(values.shape[1]):
+            indicator_pairs = [key for key in expected if indicator_nr in key]
+            indicator_pairs.sort(key=lambda key: -abs(expected[key][0]))
+            expected_keys.update(indicator_pairs[:top_k])
+        for worker_count in [1, 2]:
+            pairs = screen_indicator_matrix(
+                values, top_k=top_k, min_overlap=MIN_OVERLAP, block_size=4, worker_count=worker_count
+            )
+            self.assertEqual({(nr_a, nr_b) for nr_a, nr_b, _, _, _ in pairs}, expected_keys, worker_count)
+            for nr_a, nr_b, r, _, count in pairs:
+                self.assertAlmostEqual(r, expected[(nr_a, nr_b)][0], places=10)
+                self.assertEqual(count, expected[(nr_a, nr_b)][2])
+
+    def test_threshold(self):
+        values = make_values(40, 9, seed=3)
+        expected = calc_brute_force(values)
+        pairs = screen_indicator_matrix(values, min_abs_r=0.5, min_overlap=MIN_OVERLAP, block_size=4, worker_count=2)
+        self.assertEqual(
+            {(nr_a, nr_b) for nr_a, nr_b, _, _, _ in pairs},
+            {key for key, (r, _, _) in expected.items() if abs(r) >= 0.5}
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()